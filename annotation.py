@@ -4,6 +4,7 @@ import os
 import cv2
 from datetime import datetime
 import threading
+from supervisor import CameraSupervisor
 
 CLASS_FILE = "classes.yaml"
 IMAGES_PER_CLASS = 10
@@ -77,7 +78,11 @@ def main(page: ft.Page):
                 page.update()
                 return
 
-            cap = cv2.VideoCapture(0)
+            def camera_status(name, status, detail):
+                status_text.value = f"📷 Camera {status}" + (f": {detail}" if detail else "")
+                page.update()
+
+            cap = CameraSupervisor(0, on_change=camera_status, zoom_ratio=ZOOM_RATIO)
             box = []
             ix, iy = -1, -1
             drawing = False
@@ -99,13 +104,9 @@ def main(page: ft.Page):
 
             count = 0
             while count < IMAGES_PER_CLASS:
-                ret, frame = cap.read()
+                ret, _, frame = cap.read_roi()
                 if not ret:
                     continue
-                h, w = frame.shape[:2]
-                ch, cw = int(h * ZOOM_RATIO), int(w * ZOOM_RATIO)
-                y1, x1 = h // 2 - ch // 2, w // 2 - cw // 2
-                frame = frame[y1:y1 + ch, x1:x1 + cw]
 
                 display = frame.copy()
                 if len(box) == 2:
@@ -1,10 +1,25 @@
 import cv2
-import torch
+import os
+import time
+import yaml
 import numpy as np
 from ultralytics import YOLO
-from ultralytics.utils.ops import non_max_suppression
+from measurement import SizeMeasurer
+from capture import crop_roi as crop_center
+
+DETECTOR_CONFIG = "detector_config.yaml"
+DEFAULT_DETECTOR_CONFIG = {"imgsz": 640, "zoom_ratio": 0.5, "conf": 0.4, "iou": 0.5}
+
+def load_detector_config(path=DETECTOR_CONFIG):
+    config = dict(DEFAULT_DETECTOR_CONFIG)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config.update(yaml.safe_load(f) or {})
+    return config
 
 model = YOLO("best.pt")
+config = load_detector_config()
+measurer = SizeMeasurer.load(config["zoom_ratio"])
 
 # === Helpers ===
 def normalize_lighting(image):
@@ -46,6 +61,55 @@ def get_robust_color(hsv_pixels):
     filtered = hsv_pixels[(v_values >= v_min) & (v_values <= v_max)]
     return np.median(filtered, axis=0) if len(filtered) > 0 else np.mean(hsv_pixels, axis=0)
 
+def hsv_histogram(hsv, bins=(8, 4, 4)):
+    hist = [cv2.calcHist([hsv], [i], None, [n], [0, 180 if i == 0 else 256]).ravel() for i, n in enumerate(bins)]
+    hist = np.concatenate(hist)
+    return hist / max(hist.sum() / len(bins), 1)
+
+# === Crop preprocessing ===
+class CropPreprocessor:
+    # Color-only path: shrink the crop to a small fixed size, blur, go to HSV and equalize V.
+    # The blur is the 11x11 of the full-size path scaled to this size, and the CLAHE grid keeps
+    # about as many pixels per tile as 8x8 does on a full crop, so the clip limit acts the same.
+    # The CLAHE instance and every intermediate buffer are reused between calls.
+    def __init__(self, size=(16, 48), blur=(5, 5), tile_grid=(2, 4)):
+        self.size = size
+        self.blur = blur
+        self.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=tile_grid)
+        w, h = size
+        self.small = np.empty((h, w, 3), np.uint8)
+        self.blurred = np.empty((h, w, 3), np.uint8)
+        self.hsv = np.empty((h, w, 3), np.uint8)
+        self.v = np.empty((h, w), np.uint8)
+        self.mask = np.empty((h, w), np.uint8)
+
+    def color_hsv(self, crop):
+        cv2.resize(crop, self.size, dst=self.small, interpolation=cv2.INTER_AREA)
+        cv2.GaussianBlur(self.small, self.blur, 0, dst=self.blurred)
+        cv2.cvtColor(self.blurred, cv2.COLOR_BGR2HSV, dst=self.hsv)
+        cv2.extractChannel(self.hsv, 2, dst=self.v)
+        self.clahe.apply(self.v, dst=self.v)
+        cv2.insertChannel(self.v, self.hsv, 2)
+        return self.hsv
+
+    def robust_color(self, hsv):
+        # get_robust_color from histograms: median H/S/V of the pixels between the 20th and 80th V percentile.
+        cv2.extractChannel(hsv, 2, dst=self.v)
+        cdf = cv2.calcHist([self.v], [0], None, [256], [0, 256]).ravel().cumsum()
+        v_min, v_max = np.searchsorted(cdf, [0.2 * cdf[-1], 0.8 * cdf[-1]])
+        cv2.inRange(self.v, int(v_min), int(v_max), dst=self.mask)
+        color = []
+        for channel, bins in ((0, 180), (1, 256), (2, 256)):
+            cdf = cv2.calcHist([hsv], [channel], self.mask, [bins], [0, bins]).ravel().cumsum()
+            color.append(int(np.searchsorted(cdf, cdf[-1] / 2)))
+        return color
+
+    def color_label(self, crop):
+        hsv = self.color_hsv(crop)
+        return classify_color(self.robust_color(hsv)), hsv
+
+preprocessor = CropPreprocessor()
+
 def infer_rotated_size_from_crop(crop):
     h, w = crop.shape[:2]
     length = max(h, w)
@@ -56,49 +120,188 @@ def infer_rotated_size_from_crop(crop):
     else:
         return "unknown", length
 
-def detect_battery_from_frame(frame):
-    zoom_ratio = 0.5
-    h, w = frame.shape[:2]
-    crop_h, crop_w = int(h * zoom_ratio), int(w * zoom_ratio)
-    y1 = h // 2 - crop_h // 2
-    x1 = w // 2 - crop_w // 2
-    frame = frame[y1:y1 + crop_h, x1:x1 + crop_w]
-
-    raw_results = model.predict(source=frame, conf=0.25, verbose=False)[0]
-    boxes_tensor = raw_results.boxes.data.unsqueeze(0) if isinstance(raw_results.boxes.data, torch.Tensor) else torch.tensor(raw_results.boxes.data).unsqueeze(0)
-    boxes = non_max_suppression(boxes_tensor, conf_thres=0.4, iou_thres=0.5)[0]
+def crop_roi(frame, zoom_ratio=None):
+    return crop_center(frame, zoom_ratio or config["zoom_ratio"])
 
-    if len(boxes) == 0:
-        return None
+def predict_boxes(frame, settings=None):
+    settings = settings or config
+    # ultralytics already applies NMS with these thresholds; no second pass needed.
+    results = model.predict(source=frame, imgsz=settings["imgsz"], conf=settings["conf"], iou=settings["iou"], verbose=False)[0]
+    boxes = results.boxes.data.cpu().numpy()
+    return sorted(boxes, key=lambda x: x[4], reverse=True)
 
-    box = sorted(boxes, key=lambda x: x[4], reverse=True)[0]
+def describe_box(frame, box, w, h):
     x1, y1, x2, y2, conf, cls = map(float, box[:6])
     x1, y1, x2, y2 = map(int, [x1, y1, x2, y2])
     width = x2 - x1
     height = y2 - y1
     aspect_ratio = height / width if width != 0 else 0
 
-    if width > 0.8 * w or height > 0.8 * h or aspect_ratio > 5 or aspect_ratio < 1.2:
+    if width > 0.8 * w or height > 0.8 * h:
         return None
 
     crop = frame[y1:y2, x1:x2]
     if crop is None or crop.size == 0:
         return None
 
-    crop = normalize_lighting(crop)
-    size_label, length = infer_rotated_size_from_crop(crop)
+    # With a camera calibration, measure the rotated battery instead of the axis-aligned box,
+    # so tilted batteries are neither rejected by the aspect check nor mis-sized.
+    measurement = measurer.measure(frame, (x1, y1, x2, y2)) if measurer else None
+    if measurement:
+        aspect_ratio = measurement["aspect_ratio"]
+    if aspect_ratio > 5 or aspect_ratio < 1.2:
+        return None
+
+    if measurement:
+        size_label, length = measurement["size"], measurement["length"]
+    else:
+        size_label, length = infer_rotated_size_from_crop(crop)
     if size_label is None:
         return None
 
-    hsv = cv2.cvtColor(cv2.GaussianBlur(crop, (11, 11), 0), cv2.COLOR_BGR2HSV)
-    pixels = hsv.reshape(-1, 3)
-    avg_hsv = get_robust_color(pixels)
-    color_label = classify_color(avg_hsv)
+    color_label, hsv = preprocessor.color_label(crop)
 
     return {
         "size": size_label,
         "length": int(length),
+        "length_mm": round(measurement["length_mm"], 1) if measurement else None,
+        # "length" comes from two paths with different scales; features must not mix them.
+        "length_units": "undistorted px" if measurement else "box px",
+        "angle": round(measurement["angle"], 1) if measurement else 0.0,
         "color": color_label,
         "confidence": conf,
+        "class": int(cls),
+        "hsv_hist": [round(float(v), 4) for v in hsv_histogram(hsv)],
         "box": (x1, y1, x2, y2)
     }
+
+def detect_battery_from_frame(frame, roi=None):
+    h, w = frame.shape[:2]
+    frame = crop_roi(frame) if roi is None else roi
+
+    boxes = predict_boxes(frame)
+    if len(boxes) == 0:
+        return None
+
+    return describe_box(frame, boxes[0], w, h)
+
+# === Multi-battery mode ===
+def detect_batteries_from_frame(frame, roi=None):
+    h, w = frame.shape[:2]
+    frame = crop_roi(frame) if roi is None else roi
+
+    batteries = []
+    for box in predict_boxes(frame):
+        battery = describe_box(frame, box, w, h)
+        if battery:
+            batteries.append(battery)
+    return batteries
+
+def box_center(box):
+    x1, y1, x2, y2 = box
+    return (x1 + x2) / 2, (y1 + y2) / 2
+
+class BatteryTracker:
+    # Greedy nearest-center matching; good enough for a handful of cells on a tray.
+    def __init__(self, max_distance=40, max_missed=5):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.next_id = 1
+        self.tracks = {}
+
+    def update(self, batteries):
+        unmatched = set(self.tracks)
+        pairs = []
+        for i, battery in enumerate(batteries):
+            cx, cy = box_center(battery["box"])
+            for track_id, track in self.tracks.items():
+                tx, ty = track["center"]
+                dist = ((cx - tx) ** 2 + (cy - ty) ** 2) ** 0.5
+                if dist <= self.max_distance:
+                    pairs.append((dist, i, track_id))
+
+        assigned = {}
+        for dist, i, track_id in sorted(pairs):
+            if i in assigned or track_id not in unmatched:
+                continue
+            assigned[i] = track_id
+            unmatched.discard(track_id)
+
+        for i, battery in enumerate(batteries):
+            track_id = assigned.get(i)
+            if track_id is None:
+                track_id = self.next_id
+                self.next_id += 1
+            battery["track_id"] = track_id
+            self.tracks[track_id] = {"center": box_center(battery["box"]), "missed": 0}
+
+        for track_id in unmatched:
+            self.tracks[track_id]["missed"] += 1
+            if self.tracks[track_id]["missed"] > self.max_missed:
+                del self.tracks[track_id]
+
+        return batteries
+
+    def forget(self, track_id):
+        self.tracks.pop(track_id, None)
+
+def build_pick_queue(batteries, roi_shape, reach_weight=0.7, reachable=None):
+    # The gripper picks under the ROI center, so closer batteries are more reachable.
+    # Batteries the arm cannot pick at all are dropped via the reachable predicate.
+    if reachable is not None:
+        batteries = [b for b in batteries if reachable(b)]
+    roi_h, roi_w = roi_shape[:2]
+    px, py = roi_w / 2, roi_h / 2
+    max_dist = (px ** 2 + py ** 2) ** 0.5 or 1
+
+    def score(battery):
+        cx, cy = box_center(battery["box"])
+        reach = 1 - min(((cx - px) ** 2 + (cy - py) ** 2) ** 0.5 / max_dist, 1)
+        return reach_weight * reach + (1 - reach_weight) * battery["confidence"]
+
+    return sorted(batteries, key=score, reverse=True)
+
+# === Motion gate ===
+class MotionGate:
+    # Runs the detector only when the ROI changed since the last inference or the keep-alive expired.
+    # A pixel counts as changed above pixel_threshold; the scene changed once more than
+    # changed_fraction of the pixels did (a single battery covers roughly 3% of the ROI).
+    def __init__(self, pixel_threshold=25, changed_fraction=0.01, keepalive=5.0, size=(80, 60)):
+        self.pixel_threshold = pixel_threshold
+        self.changed_fraction = changed_fraction
+        self.keepalive = keepalive
+        self.size = size
+        self.reference = None
+        self.last_result = None
+        self.last_run = 0.0
+        self.inferences = 0
+        self.skipped = 0
+
+    def changed(self, frame, roi=None):
+        small = cv2.resize(crop_roi(frame) if roi is None else roi, self.size, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.reference is None:
+            return small, True
+        changed = (cv2.absdiff(small, self.reference) > self.pixel_threshold).mean() > self.changed_fraction
+        return small, changed
+
+    def run(self, detect, frame, roi=None):
+        small, changed = self.changed(frame, roi)
+        now = time.monotonic()
+        if changed or now - self.last_run >= self.keepalive:
+            self.last_result = detect(frame, roi)
+            self.reference = small
+            self.last_run = now
+            self.inferences += 1
+        else:
+            self.skipped += 1
+        return self.last_result
+
+    def reset(self):
+        self.reference = None
+        self.last_result = None
+
+    def stats(self):
+        total = self.inferences + self.skipped
+        rate = 100 * self.skipped / total if total else 0
+        return f"{self.inferences} inferences, {self.skipped} skipped ({rate:.0f}%)"
@@ -0,0 +1,40 @@
+import time
+import cv2
+from capture import load_capture_config, negotiate_capture, describe_capture, crop_roi
+from battery_detector import config as detector_config
+
+CAMERA_INDEX = 0
+FRAMES = 60
+
+def measure(cap):
+    grab_ms = decode_ms = 0.0
+    for _ in range(5):
+        cap.read()
+    for _ in range(FRAMES):
+        start = time.perf_counter()
+        cap.grab()
+        grabbed = time.perf_counter()
+        ret, frame = cap.retrieve()
+        decoded = time.perf_counter()
+        crop_roi(frame, detector_config["zoom_ratio"])
+        grab_ms += (grabbed - start) * 1000
+        decode_ms += (decoded - grabbed) * 1000
+    return grab_ms / FRAMES, decode_ms / FRAMES
+
+def report(label, cap):
+    c = describe_capture(cap)
+    grab_ms, decode_ms = measure(cap)
+    print(f"{label:<22} {c['width']}x{c['height']} {c['fourcc']} @ {c['fps']:.0f} fps | wait {grab_ms:6.2f} ms | decode {decode_ms:6.2f} ms/frame")
+
+if __name__ == "__main__":
+    config = load_capture_config()
+
+    cap = cv2.VideoCapture(CAMERA_INDEX)
+    report("Before (camera default)", cap)
+    cap.release()
+
+    for fourcc in ("MJPG", "YUYV"):
+        cap = cv2.VideoCapture(CAMERA_INDEX)
+        negotiate_capture(cap, {**config, "fourcc": fourcc})
+        report(f"After ({fourcc})", cap)
+        cap.release()
@@ -0,0 +1,71 @@
+import os
+import time
+import cv2
+import numpy as np
+from battery_detector import normalize_lighting, get_robust_color, classify_color, CropPreprocessor
+
+CROP_DIRS = [("images/train", "labels/train"), ("images/val", "labels/val")]
+ITERATIONS = 20
+
+def load_crops():
+    crops = []
+    for img_dir, lbl_dir in CROP_DIRS:
+        if not os.path.isdir(img_dir):
+            continue
+        for name in os.listdir(img_dir):
+            frame = cv2.imread(os.path.join(img_dir, name))
+            label_path = os.path.join(lbl_dir, os.path.splitext(name)[0] + ".txt")
+            if frame is None or not os.path.exists(label_path):
+                continue
+            h, w = frame.shape[:2]
+            with open(label_path, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 5:
+                        continue
+                    _, xc, yc, bw, bh = map(float, parts)
+                    x1, y1 = int((xc - bw / 2) * w), int((yc - bh / 2) * h)
+                    x2, y2 = int((xc + bw / 2) * w), int((yc + bh / 2) * h)
+                    crop = frame[max(y1, 0):y2, max(x1, 0):x2]
+                    if crop.size:
+                        crops.append(crop)
+    if not crops:
+        # No dataset on disk: synthetic battery-sized crops with a colored label band.
+        rng = np.random.default_rng(0)
+        for _ in range(50):
+            crop = rng.integers(0, 60, (rng.integers(110, 150), rng.integers(30, 45), 3), dtype=np.uint8)
+            crop[20:-20] = rng.integers(0, 256, 3)
+            crops.append(crop)
+    return crops
+
+def current_color(crop):
+    crop = normalize_lighting(crop)
+    hsv = cv2.cvtColor(cv2.GaussianBlur(crop, (11, 11), 0), cv2.COLOR_BGR2HSV)
+    return classify_color(get_robust_color(hsv.reshape(-1, 3)))
+
+def time_per_crop(fn, crops):
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        for crop in crops:
+            fn(crop)
+    return (time.perf_counter() - start) * 1e6 / (ITERATIONS * len(crops))
+
+if __name__ == "__main__":
+    crops = load_crops()
+    preprocessor = CropPreprocessor()
+    pipelined = lambda crop: preprocessor.color_label(crop)[0]
+
+    old_us = time_per_crop(current_color, crops)
+    new_us = time_per_crop(pipelined, crops)
+    mismatches = [(i, current_color(c), pipelined(c)) for i, c in enumerate(crops) if current_color(c) != pipelined(c)]
+    agree = 1 - len(mismatches) / len(crops)
+
+    print(f"📦 {len(crops)} crops x {ITERATIONS} iterations")
+    print(f"⏱ Current helpers:  {old_us:8.1f} µs/crop")
+    print(f"⏱ CropPreprocessor: {new_us:8.1f} µs/crop ({old_us / new_us:.1f}x)")
+    print(f"🎨 Color label agreement: {agree:.1%}")
+    # green and blue are the colors the chemistry rules treat specially.
+    rule_colors = sum(1 for _, old, new in mismatches if {old, new} & {"green", "blue"})
+    print(f"   {rule_colors} of {len(mismatches)} mismatches involve green or blue")
+    for i, old, new in mismatches:
+        print(f"   crop {i} {crops[i].shape[1]}x{crops[i].shape[0]}: current {old!r} vs CropPreprocessor {new!r}")
@@ -0,0 +1,71 @@
+import cv2
+import yaml
+import numpy as np
+from measurement import CAMERA_CALIBRATION
+from supervisor import CameraSupervisor
+from battery_detector import config as detector_config
+
+CHESSBOARD = (9, 6)  # inner corners
+SQUARE_MM = 25.0
+MIN_VIEWS = 8
+
+def corner_spacing_px(corners, camera_matrix, dist_coeffs):
+    # Undistorted distance between neighbouring corners, averaged over the board.
+    points = cv2.undistortPoints(corners, camera_matrix, dist_coeffs, P=camera_matrix).reshape(CHESSBOARD[1], CHESSBOARD[0], 2)
+    dx = np.linalg.norm(np.diff(points, axis=1), axis=2)
+    dy = np.linalg.norm(np.diff(points, axis=0), axis=2)
+    return float(np.concatenate([dx.ravel(), dy.ravel()]).mean())
+
+if __name__ == "__main__":
+    objp = np.zeros((CHESSBOARD[0] * CHESSBOARD[1], 3), np.float32)
+    objp[:, :2] = np.mgrid[0:CHESSBOARD[0], 0:CHESSBOARD[1]].T.reshape(-1, 2) * SQUARE_MM
+
+    # Negotiate the same capture the sorter uses: mm_per_pixel only holds at this resolution.
+    cap = CameraSupervisor(0, zoom_ratio=detector_config["zoom_ratio"])
+    if not cap.open():
+        raise SystemExit("❌ Could not open webcam.")
+    image_size = (cap.capture["width"], cap.capture["height"])
+    object_points, image_points = [], []
+    print(f"📷 Capture: {cap.stats()}")
+    print(f"📸 Show the chessboard at varied angles and press 'c' to capture ({MIN_VIEWS}+ views).")
+    print("   Capture the LAST view lying flat on the tray: it sets the mm scale. Press 'q' to finish.")
+
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            continue
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        found, corners = cv2.findChessboardCorners(gray, CHESSBOARD)
+        display = frame.copy()
+        if found:
+            cv2.drawChessboardCorners(display, CHESSBOARD, corners, found)
+        cv2.putText(display, f"Views: {len(image_points)}", (10, 25), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.imshow("Camera Calibration", display)
+        key = cv2.waitKey(1) & 0xFF
+
+        if key == ord('c') and found and gray.shape[::-1] != image_size:
+            print(f"⚠️ Frame is {gray.shape[1]}x{gray.shape[0]}, not the negotiated {image_size[0]}x{image_size[1]}; view skipped.")
+        elif key == ord('c') and found:
+            corners = cv2.cornerSubPix(gray, corners, (11, 11), (-1, -1),
+                                       (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001))
+            object_points.append(objp)
+            image_points.append(corners)
+        elif key == ord('q'):
+            break
+
+    cap.release()
+    cv2.destroyAllWindows()
+
+    if len(image_points) < MIN_VIEWS:
+        print(f"❌ Only {len(image_points)} views captured; need {MIN_VIEWS}.")
+    else:
+        error, camera_matrix, dist_coeffs, _, _ = cv2.calibrateCamera(object_points, image_points, image_size, None, None)
+        mm_per_pixel = SQUARE_MM / corner_spacing_px(image_points[-1], camera_matrix, dist_coeffs)
+        with open(CAMERA_CALIBRATION, 'w') as f:
+            yaml.dump({
+                "image_size": list(image_size),
+                "camera_matrix": camera_matrix.tolist(),
+                "dist_coeffs": dist_coeffs.ravel().tolist(),
+                "mm_per_pixel": mm_per_pixel,
+            }, f)
+        print(f"✅ Reprojection error {error:.3f} px | {mm_per_pixel:.4f} mm/px → saved to {CAMERA_CALIBRATION}")
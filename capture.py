@@ -0,0 +1,41 @@
+import os
+import cv2
+import yaml
+
+CAPTURE_CONFIG = "capture_config.yaml"
+# width / height: the capture the recordings, pixel size windows and tuner scores were taken at.
+# It stays fixed whatever zoom_ratio is, so a zoom change only changes the crop, never pixels per mm.
+DEFAULT_CAPTURE_CONFIG = {"fourcc": "YUYV", "fps": 30, "width": 640, "height": 480}
+
+def load_capture_config(path=CAPTURE_CONFIG):
+    config = dict(DEFAULT_CAPTURE_CONFIG)
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config.update(yaml.safe_load(f) or {})
+    return config
+
+def crop_roi(frame, zoom_ratio):
+    # Slicing returns a view into the captured frame; nothing is copied.
+    h, w = frame.shape[:2]
+    crop_h, crop_w = int(h * zoom_ratio), int(w * zoom_ratio)
+    y1 = h // 2 - crop_h // 2
+    x1 = w // 2 - crop_w // 2
+    return frame[y1:y1 + crop_h, x1:x1 + crop_w]
+
+def negotiate_capture(cap, config=None):
+    config = config or load_capture_config()
+    # FOURCC has to be set before the size for most UVC backends to honour it.
+    cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*config["fourcc"]))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, config["width"])
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, config["height"])
+    cap.set(cv2.CAP_PROP_FPS, config["fps"])
+    return describe_capture(cap)
+
+def describe_capture(cap):
+    code = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return {
+        "fourcc": "".join(chr((code >> 8 * i) & 0xFF) for i in range(4)),
+        "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        "fps": cap.get(cv2.CAP_PROP_FPS),
+    }
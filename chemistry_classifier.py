@@ -0,0 +1,219 @@
+import os
+import functools
+import numpy as np
+from sort_db import SORT_DB, connect, labeled_events
+
+MODEL_FILE = "chemistry_model.npz"
+CHEMISTRIES = ["alkaline", "NiMH", "zinc", "lithium"]  # labels a person can confirm
+NUM_DETECTOR_CLASSES = 3  # names in classes.yaml
+HIST_BINS = 16
+# Grams a battery of each size can physically weigh; readings outside are scale errors, not chemistries.
+SIZE_WEIGHTS = {"AA": (10.0, 30.0), "AAA": (3.0, 14.0)}
+SWEEP_STEP = 0.1
+MIN_WEIGHED = 30  # weighed items of a size/color before their observed range narrows the sweep
+MIN_LABELS = 20
+VALIDATION_SPLIT = 0.2
+TEMPERATURES = np.exp(np.linspace(np.log(0.25), np.log(10.0), 60))
+
+# === Rule-based classification ===
+def classify_by_rules(size, color, weight):
+    if size == "AA":
+        if color == "green" and 20 <= weight < 24:
+            return "unknown"
+        elif 20 <= weight < 24:
+            return "alkaline"
+        elif 13 <= weight < 15 or 17<=weight<18:
+            return "lithium"
+        elif color=="blue" and 24 <= weight <= 27:
+            return "unknown"
+        elif 24 <= weight <= 27:
+            return "NiMH"
+        elif 14 <= weight < 17 or 10<=weight<13:
+            return "zinc"
+        else:
+            return "unknown"
+    elif size == "AAA":
+        if color == "green" and 9 <= weight <= 11:
+            return "unknown"
+        elif 9 <= weight <= 11:
+            return "alkaline"
+        elif 5 < weight < 9:
+            return "zinc"
+        elif 3 <= weight < 5:
+            return "lithium"
+        elif color=="blue" and 11 < weight <= 13:
+            return "unknown"
+        elif 11 < weight <= 13:
+            return "NiMH"
+    return "unknown"
+
+def weight_sweep(low, high):
+    return np.arange(low, high + SWEEP_STEP / 2, SWEEP_STEP)
+
+def weight_window(size, color, weight_ranges=None):
+    # Weights to sweep for this size/color: what it has actually weighed so far (once there are
+    # MIN_WEIGHED readings), kept inside the plausible range for the size. None for unknown sizes.
+    if size not in SIZE_WEIGHTS:
+        return None
+    low, high = SIZE_WEIGHTS[size]
+    observed = (weight_ranges or {}).get((size, color))
+    if observed and observed[2] >= MIN_WEIGHED:
+        low, high = max(low, observed[0]), min(high, observed[1])
+    return (round(low, 1), round(high, 1)) if low <= high else None
+
+@functools.lru_cache(maxsize=None)
+def vision_only_class(size, color, low, high):
+    # The class the rules give for this size/color at every weight in [low, high], or None if weight matters.
+    # "unknown" never qualifies: those items still get weighed and logged.
+    classes = {classify_by_rules(size, color, float(w)) for w in weight_sweep(low, high)}
+    return classes.pop() if len(classes) == 1 and "unknown" not in classes else None
+
+def fast_path_pairs(weight_ranges):
+    # Every weighed size/color the fast path currently covers, with the class it sorts them as.
+    pairs = {}
+    for size, color in weight_ranges:
+        window = weight_window(size, color, weight_ranges)
+        vision_class = vision_only_class(size, color, *window) if window else None
+        if vision_class:
+            pairs[(size, color)] = vision_class
+    return pairs
+
+def unambiguous_class(battery, weight_ranges=None, classifier=None, min_confidence=0.85):
+    # vision_only_class, unless a loaded classifier would override the rules with another class at some weight.
+    window = weight_window(battery["size"], battery["color"], weight_ranges)
+    if window is None:
+        return None
+    vision_class = vision_only_class(battery["size"], battery["color"], *window)
+    if vision_class is None or classifier is None:
+        return vision_class
+    if not classifier.accepts(battery):
+        return None
+    probs = classifier.predict_proba(np.stack([build_features(battery, float(w)) for w in weight_sweep(*window)]))
+    overrides = probs.argmax(axis=1)[probs.max(axis=1) >= min_confidence]
+    if any(classifier.classes[i] != vision_class for i in overrides):
+        return None
+    return vision_class
+
+# === Features ===
+def build_features(battery, weight):
+    length = float(battery["length"])
+    detector_class = np.zeros(NUM_DETECTOR_CLASSES)
+    detector_class[min(int(battery.get("class", 0)), NUM_DETECTOR_CLASSES - 1)] = 1
+    hist = battery.get("hsv_hist") or np.zeros(HIST_BINS)
+    return np.concatenate([
+        [weight, weight ** 2, length, length ** 2, weight * length],
+        detector_class,
+        hist,
+    ]).astype(np.float32)
+
+def softmax(z):
+    z = z - z.max(axis=1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=1, keepdims=True)
+
+def measurement_context(battery):
+    # What the length feature depends on: the ROI, the capture it was cut from and the measuring path.
+    return {
+        "zoom_ratio": battery.get("zoom_ratio"),
+        "image_size": list(battery.get("image_size") or []),
+        "length_units": battery.get("length_units"),
+    }
+
+# === Training ===
+def train(db_path=SORT_DB, model_path=MODEL_FILE, epochs=2000, lr=0.1, l2=1e-3, seed=0):
+    conn = connect(db_path)
+    records = labeled_events(conn)
+    conn.close()
+    if not records:
+        raise ValueError(f"No human-confirmed labels in {db_path}")
+
+    # Train for the setup of the most recent label only; rows measured another way are left out.
+    context = measurement_context(records[-1][0])
+    if context["zoom_ratio"] is None or not context["image_size"]:
+        raise ValueError("The latest labels have no capture context; sort and label new batteries first.")
+    records = [r for r in records if measurement_context(r[0]) == context]
+    if len(records) < MIN_LABELS:
+        raise ValueError(f"Only {len(records)} labels for {context}; need {MIN_LABELS}.")
+
+    classes = sorted({label for _, _, label in records})
+    X = np.stack([build_features(battery, weight) for battery, weight, _ in records])
+    y = np.array([classes.index(label) for _, _, label in records])
+
+    order = np.random.default_rng(seed).permutation(len(X))
+    held_out = max(1, int(len(X) * VALIDATION_SPLIT))
+    val, fit = order[:held_out], order[held_out:]
+    mean, std = X[fit].mean(axis=0), X[fit].std(axis=0) + 1e-6
+    X = (X - mean) / std
+    Y = np.eye(len(classes))[y]
+
+    W = np.zeros((X.shape[1], len(classes)), dtype=np.float32)
+    b = np.zeros(len(classes), dtype=np.float32)
+    for _ in range(epochs):
+        grad = (softmax(X[fit] @ W + b) - Y[fit]) / len(fit)
+        W -= lr * (X[fit].T @ grad + l2 * W)
+        b -= lr * grad.sum(axis=0)
+
+    # Temperature scaling on the held-out split, so a 0.85 confidence means roughly 85% correct.
+    logits = X[val] @ W + b
+    nll = [-np.log(softmax(logits / t)[np.arange(len(val)), y[val]] + 1e-12).mean() for t in TEMPERATURES]
+    temperature = float(TEMPERATURES[int(np.argmin(nll))])
+
+    train_accuracy = float((softmax(X[fit] @ W + b).argmax(axis=1) == y[fit]).mean())
+    val_accuracy = float((logits.argmax(axis=1) == y[val]).mean())
+    np.savez(model_path, W=W, b=b, mean=mean, std=std, classes=np.array(classes), temperature=temperature,
+             zoom_ratio=context["zoom_ratio"], image_size=np.array(context["image_size"]),
+             length_units=context["length_units"])
+    return {"train_accuracy": train_accuracy, "val_accuracy": val_accuracy, "temperature": temperature,
+            "count": len(records), "held_out": held_out, "context": context}
+
+# === Inference ===
+class ChemistryClassifier:
+    def __init__(self, model_path=MODEL_FILE):
+        data = np.load(model_path)
+        self.W = data["W"]
+        self.b = data["b"]
+        self.mean = data["mean"]
+        self.std = data["std"]
+        self.classes = [str(c) for c in data["classes"]]
+        self.temperature = float(data["temperature"])
+        self.context = {
+            "zoom_ratio": float(data["zoom_ratio"]),
+            "image_size": [int(v) for v in data["image_size"]],
+            "length_units": str(data["length_units"]),
+        }
+
+    @classmethod
+    def load(cls, model_path=MODEL_FILE, zoom_ratio=None, image_size=None):
+        # None when there is no model, or when it was trained on another ROI or capture size.
+        if not os.path.exists(model_path):
+            return None
+        with np.load(model_path) as data:
+            if "length_units" not in data.files:
+                return None  # trained before the measurement context was recorded
+        classifier = cls(model_path)
+        if zoom_ratio is not None and classifier.context["zoom_ratio"] != zoom_ratio:
+            return None
+        if image_size is not None and classifier.context["image_size"] != list(image_size):
+            return None
+        return classifier
+
+    def accepts(self, battery):
+        # Lengths measured on another path are on another scale.
+        return battery.get("length_units") == self.context["length_units"]
+
+    def predict_proba(self, X):
+        return softmax((((np.atleast_2d(X) - self.mean) / self.std) @ self.W + self.b) / self.temperature)
+
+    def predict(self, battery, weight):
+        if not self.accepts(battery):
+            return None, 0.0
+        probs = self.predict_proba(build_features(battery, weight))[0]
+        best = int(probs.argmax())
+        return self.classes[best], float(probs[best])
+
+if __name__ == "__main__":
+    result = train()
+    print(f"✅ Trained on {result['count'] - result['held_out']} sort results, validated on {result['held_out']} "
+          f"| training accuracy: {result['train_accuracy']:.1%} | validation accuracy: {result['val_accuracy']:.1%} "
+          f"| temperature {result['temperature']:.2f} | saved to {MODEL_FILE}")
+    print(f"   Measurement context: {result['context']}")
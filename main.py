@@ -1,6 +1,11 @@
 import flet as ft
 import subprocess
 import os
+import threading
+import time
+from datetime import datetime
+from sort_db import SORT_DB, connect, throughput, class_mix, unknown_rate_by_size, unlabeled_events, set_label
+from chemistry_classifier import CHEMISTRIES
 
 def main(page: ft.Page):
     page.title = "Zapsortbot | Control Panel"
@@ -67,6 +72,110 @@ def main(page: ft.Page):
 
     page.add(ft.Column(card_rows, alignment=ft.MainAxisAlignment.CENTER, spacing=25))
 
+    # === Dashboard ===
+    throughput_text = ft.Text("Throughput: —", size=14, weight=ft.FontWeight.BOLD, color=ft.colors.BLUE_200)
+    buckets_text = ft.Text("", size=12, color=ft.colors.GREY_400)
+    mix_text = ft.Text("", size=12)
+    unknown_text = ft.Text("", size=12, color=ft.colors.ORANGE_200)
+
+    def refresh_dashboard(e=None):
+        if not os.path.exists(SORT_DB):
+            throughput_text.value = "Throughput: no sort events yet"
+            page.update()
+            return
+        conn = connect(SORT_DB)
+        try:
+            per_hour, buckets = throughput(conn)
+            mix = class_mix(conn)
+            unknown = unknown_rate_by_size(conn)
+        finally:
+            conn.close()
+
+        throughput_text.value = f"Throughput (last hour): {per_hour:.0f} items/h"
+        buckets_text.value = "  ".join(f"{datetime.fromtimestamp(t):%H:%M} {n}" for t, n in buckets)
+        mix_text.value = "\n".join(
+            f"{cls:<10} {n:>5}  avg {avg:.1f} g  ({lo:.1f}–{hi:.1f} g)" if avg is not None else f"{cls:<10} {n:>5}"
+            for cls, n, avg, lo, hi in mix
+        ) or "No items in the last hour."
+        unknown_text.value = "  ".join(f"{size}: {rate:.0%} unknown ({n})" for size, rate, n in unknown)
+        page.update()
+
+    def auto_refresh():
+        while True:
+            try:
+                refresh_dashboard()
+            except Exception as e:
+                throughput_text.value = f"Dashboard error: {e}"
+                page.update()
+            time.sleep(10)
+
+    page.add(ft.Divider())
+    page.add(ft.Column([
+        ft.Row([
+            ft.Text("Production Dashboard", size=16, weight=ft.FontWeight.BOLD),
+            ft.IconButton(icon=ft.icons.REFRESH, on_click=refresh_dashboard)
+        ]),
+        throughput_text,
+        buckets_text,
+        mix_text,
+        unknown_text
+    ], spacing=8))
+    threading.Thread(target=auto_refresh, daemon=True).start()
+
+    # === Label Review ===
+    # The chemistry classifier trains only on labels confirmed here: check the battery in its bin,
+    # then save the sorted class or pick the actual one.
+    review = {"events": [], "skipped": set()}
+    review_text = ft.Text("", size=12)
+    label_dropdown = ft.Dropdown(label="Actual chemistry", options=[ft.dropdown.Option(c) for c in CHEMISTRIES], width=200)
+
+    def show_next_event(e=None):
+        if not review["events"] and os.path.exists(SORT_DB):
+            conn = connect(SORT_DB)
+            try:
+                review["events"] = [r for r in unlabeled_events(conn) if r[0] not in review["skipped"]]
+            finally:
+                conn.close()
+        if not review["events"]:
+            review_text.value = "No weighed events waiting for a label."
+            label_dropdown.value = None
+        else:
+            event_id, dropped, size, color, weight, classification = review["events"][0]
+            review_text.value = f"#{event_id} {datetime.fromtimestamp(dropped):%H:%M:%S} | {size}, {color} | {weight:.2f} g | sorted as {classification.upper()}"
+            label_dropdown.value = classification if classification in CHEMISTRIES else None
+        page.update()
+
+    def save_label(e):
+        if not review["events"] or not label_dropdown.value:
+            return
+        conn = connect(SORT_DB)
+        try:
+            set_label(conn, review["events"][0][0], label_dropdown.value)
+        finally:
+            conn.close()
+        review["events"].pop(0)
+        show_next_event()
+
+    def skip_event(e):
+        if review["events"]:
+            review["skipped"].add(review["events"].pop(0)[0])
+        show_next_event()
+
+    page.add(ft.Divider())
+    page.add(ft.Column([
+        ft.Row([
+            ft.Text("Label Review", size=16, weight=ft.FontWeight.BOLD),
+            ft.IconButton(icon=ft.icons.REFRESH, on_click=show_next_event)
+        ]),
+        review_text,
+        ft.Row([
+            label_dropdown,
+            ft.ElevatedButton("Save label", icon=ft.icons.CHECK, on_click=save_label),
+            ft.ElevatedButton("Skip", icon=ft.icons.SKIP_NEXT, on_click=skip_event)
+        ])
+    ], spacing=8))
+    show_next_event()
+
     # === Footer ===
     page.add(ft.Divider())
     page.add(ft.Text("Welcome to Zapsortbot!", size=12, text_align=ft.TextAlign.CENTER))
@@ -0,0 +1,105 @@
+import os
+import cv2
+import yaml
+import numpy as np
+
+CAMERA_CALIBRATION = "camera_calibration.yaml"
+
+# Nominal lengths: AAA 44.5 mm, AA 50.5 mm.
+SIZE_WINDOWS_MM = {"AAA": (41.5, 47.5), "AA": (47.5, 53.5)}
+MASK_MARGIN = 8
+
+def load_camera_calibration(path=CAMERA_CALIBRATION):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return yaml.safe_load(f)
+
+def size_from_mm(length_mm):
+    for label, (lo, hi) in SIZE_WINDOWS_MM.items():
+        if lo <= length_mm < hi:
+            return label
+    return "unknown"
+
+class SizeMeasurer:
+    # Undistorts only the pixels around a detection using remap tables built once per ROI,
+    # then measures the battery's long axis with a rotated rectangle on its mask.
+    def __init__(self, calibration, zoom_ratio):
+        self.camera_matrix = np.array(calibration["camera_matrix"], dtype=np.float64)
+        self.dist_coeffs = np.array(calibration["dist_coeffs"], dtype=np.float64)
+        self.mm_per_pixel = float(calibration["mm_per_pixel"])
+        self.image_size = tuple(calibration["image_size"])  # (w, h) of the calibrated capture
+        self.zoom_ratio = zoom_ratio
+        self.maps = {}
+
+    @classmethod
+    def load(cls, zoom_ratio, path=CAMERA_CALIBRATION):
+        calibration = load_camera_calibration(path)
+        return cls(calibration, zoom_ratio) if calibration else None
+
+    def matches(self, image_size):
+        return self.image_size == tuple(image_size)
+
+    def _roi_maps(self, roi_shape):
+        key = roi_shape[:2]
+        if key not in self.maps:
+            w, h = self.image_size
+            crop_h, crop_w = int(h * self.zoom_ratio), int(w * self.zoom_ratio)
+            if (crop_h, crop_w) != key:
+                self.maps[key] = None
+            else:
+                # Same lens model, principal point shifted into ROI coordinates.
+                x0, y0 = w // 2 - crop_w // 2, h // 2 - crop_h // 2
+                matrix = self.camera_matrix.copy()
+                matrix[0, 2] -= x0
+                matrix[1, 2] -= y0
+                self.maps[key] = cv2.initUndistortRectifyMap(
+                    matrix, self.dist_coeffs, None, matrix, (crop_w, crop_h), cv2.CV_16SC2)
+        return self.maps[key]
+
+    def measure(self, roi, box):
+        maps = self._roi_maps(roi.shape)
+        if maps is None:
+            return None
+        roi_h, roi_w = roi.shape[:2]
+        x1, y1, x2, y2 = box
+        x1, y1 = max(x1 - MASK_MARGIN, 0), max(y1 - MASK_MARGIN, 0)
+        x2, y2 = min(x2 + MASK_MARGIN, roi_w), min(y2 + MASK_MARGIN, roi_h)
+        if x2 <= x1 or y2 <= y1:
+            return None
+
+        map1, map2 = maps
+        patch = cv2.remap(roi, map1[y1:y2, x1:x2], map2[y1:y2, x1:x2], cv2.INTER_LINEAR)
+
+        gray = cv2.GaussianBlur(cv2.cvtColor(patch, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+        _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        ph, pw = mask.shape
+        # The detection is centered on the battery, so the center pixel tells us the mask polarity.
+        if mask[ph // 2, pw // 2] == 0:
+            mask = cv2.bitwise_not(mask)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        if not contours:
+            return None
+        contour = max(contours, key=cv2.contourArea)
+        (_, _), (rw, rh), angle = cv2.minAreaRect(contour)
+        if min(rw, rh) == 0:
+            return None
+
+        length_px = max(rw, rh)
+        # Tilt of the long axis from image vertical, in (-90, 90].
+        tilt = angle if rh >= rw else angle - 90
+        if tilt > 90:
+            tilt -= 180
+        elif tilt <= -90:
+            tilt += 180
+
+        length_mm = length_px * self.mm_per_pixel
+        return {
+            "size": size_from_mm(length_mm),
+            "length": length_px,
+            "length_mm": length_mm,
+            "angle": tilt,
+            "aspect_ratio": max(rw, rh) / min(rw, rh),
+        }
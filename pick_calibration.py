@@ -0,0 +1,85 @@
+import math
+import os
+import cv2
+import yaml
+import numpy as np
+from pyniryo import PoseObject
+
+CALIBRATION_FILE = "pick_calibration.yaml"
+MIN_POINTS = 4
+WORKSPACE_MARGIN = 0.03  # metres beyond the taught points still accepted
+
+# Each point pairs a detection box center (ROI pixels) with the arm pose taught over it,
+# and records the capture size (w, h) it was marked at: ROI pixels only mean the same thing at that size.
+def compute_calibration(points, zoom_ratio):
+    if len(points) < MIN_POINTS:
+        raise ValueError(f"Need at least {MIN_POINTS} points, got {len(points)}")
+    image_sizes = {tuple(p["image_size"]) for p in points}
+    if len(image_sizes) != 1:
+        raise ValueError("Points were marked at different capture sizes; teach them again.")
+    pixels = np.float32([p["pixel"] for p in points])
+    poses = np.float32([p["pose"] for p in points])
+    homography, _ = cv2.findHomography(pixels, poses[:, :2])
+    if homography is None:
+        raise ValueError("Points are degenerate; spread them across the ROI.")
+    return {
+        "zoom_ratio": zoom_ratio,
+        "image_size": list(image_sizes.pop()),
+        "homography": homography.tolist(),
+        "z": float(poses[:, 2].mean()),
+        "orientation": [float(v) for v in poses[0, 3:6]],
+        "points": points,
+    }
+
+def save_calibration(calibration, path=CALIBRATION_FILE):
+    with open(path, 'w') as f:
+        yaml.dump(calibration, f)
+
+class PickCalibration:
+    def __init__(self, calibration):
+        self.zoom_ratio = calibration["zoom_ratio"]
+        self.image_size = tuple(calibration.get("image_size") or ())  # (w, h) of the capture it was taught on
+        self.homography = np.array(calibration["homography"], dtype=np.float64)
+        self.z = calibration["z"]
+        self.roll, self.pitch, self.yaw = calibration["orientation"]
+        xy = np.array([p["pose"][:2] for p in calibration["points"]])
+        self.lower = xy.min(axis=0) - WORKSPACE_MARGIN
+        self.upper = xy.max(axis=0) + WORKSPACE_MARGIN
+
+    @classmethod
+    def load(cls, path=CALIBRATION_FILE):
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r') as f:
+            return cls(yaml.safe_load(f))
+
+    def matches(self, zoom_ratio, image_size):
+        return self.zoom_ratio == zoom_ratio and self.image_size == tuple(image_size)
+
+    def pixel_to_robot(self, u, v):
+        x, y = cv2.perspectiveTransform(np.array([[[u, v]]], dtype=np.float64), self.homography)[0, 0]
+        return float(x), float(y)
+
+    def yaw_offset(self, u, v, angle, step=20.0):
+        # "angle" is the battery's tilt from image vertical (degrees), and calibration points are
+        # taught on upright batteries. Map both axes through the homography and compare them in robot XY.
+        t = math.radians(angle)
+        pixels = np.array([[[u, v], [u, v + step], [u - step * math.sin(t), v + step * math.cos(t)]]], dtype=np.float64)
+        center, upright, axis = cv2.perspectiveTransform(pixels, self.homography)[0]
+        (ux, uy), (ax, ay) = upright - center, axis - center
+        offset = math.atan2(ux * ay - uy * ax, ux * ax + uy * ay)
+        # A battery has no head or tail, so keep the smaller of the two equivalent turns.
+        if offset > math.pi / 2:
+            offset -= math.pi
+        elif offset <= -math.pi / 2:
+            offset += math.pi
+        return offset
+
+    def pick_pose(self, battery):
+        x1, y1, x2, y2 = battery["box"]
+        u, v = (x1 + x2) / 2, (y1 + y2) / 2
+        x, y = self.pixel_to_robot(u, v)
+        if not (self.lower[0] <= x <= self.upper[0] and self.lower[1] <= y <= self.upper[1]):
+            return None
+        yaw = self.yaw + self.yaw_offset(u, v, battery.get("angle", 0.0))
+        return PoseObject(x, y, self.z, self.roll, self.pitch, yaw)
@@ -2,13 +2,18 @@ import flet as ft
 import threading
 import cv2
 import base64
+import math
 import time
 import traceback
-from pyniryo import NiryoRobot
-from battery_detector import detect_battery_from_frame
+from robot_service import RobotService
+from battery_detector import detect_battery_from_frame, MotionGate
+from battery_detector import config as detector_config
+from pick_calibration import compute_calibration, save_calibration, MIN_POINTS
+from supervisor import CameraSupervisor
 
 ROBOT_IP = "172.20.10.4"
 POSE_FILE = "robot_classification.py"
+VIEW_TOLERANCE = (0.005, 0.05)  # metres, radians: how close to VIEW_POSITION the camera must be when marking
 
 pose_names = [
     "VIEW_POSITION", "WEIGHT_DROP", "PICK_POSITION", "LIFT_POSITION",
@@ -30,6 +35,18 @@ def save_pose_to_file(name, pose):
     except Exception as e:
         return str(e)
 
+def load_pose_from_file(name):
+    with open(POSE_FILE, 'r', encoding="utf-8") as file:
+        for line in file:
+            if line.strip().startswith(f"{name} = PoseObject"):
+                return [float(v) for v in line.split("(", 1)[1].split(")", 1)[0].split(",")]
+    return None
+
+def near_pose(pose, target, tolerance=VIEW_TOLERANCE):
+    position = max(abs(a - b) for a, b in zip([pose.x, pose.y, pose.z], target[:3]))
+    rotation = max(abs((a - b + math.pi) % (2 * math.pi) - math.pi) for a, b in zip([pose.roll, pose.pitch, pose.yaw], target[3:]))
+    return position <= tolerance[0] and rotation <= tolerance[1]
+
 def encode_frame(frame):
     _, buffer = cv2.imencode('.jpg', frame)
     return base64.b64encode(buffer).decode()
@@ -49,12 +66,16 @@ def main(page: ft.Page):
         width=300
     )
     image = ft.Image(width=480, height=360, fit=ft.ImageFit.CONTAIN)
+    calibration_text = ft.Text(f"Pick calibration: 0/{MIN_POINTS} points", size=12, color=ft.colors.BLUE_200)
+    last_detection = {"result": None, "image_size": None}
+    calibration_points = []
+    marked_pixel = {"center": None, "image_size": None}
 
     # === Robot Connection ===
     global robot
     robot = None
     try:
-        robot = NiryoRobot(ROBOT_IP)
+        robot = RobotService(ROBOT_IP).start()
         robot.update_tool()
         robot.calibrate_auto()
         status_text.value = "✅ Connected to robot and tool updated."
@@ -72,7 +93,7 @@ def main(page: ft.Page):
             page.update()
             return
         try:
-            pose = robot.get_pose()
+            pose = robot.get_pose(max_age=0)
             result = save_pose_to_file(pose_name, pose)
             if result is True:
                 status_text.value = f"✅ {pose_name} updated."
@@ -85,30 +106,77 @@ def main(page: ft.Page):
             status_text.color = ft.colors.RED_400
         page.update()
 
+    # === Pick Calibration ===
+    # Place a battery, mark it with the arm at VIEW_POSITION (the only pose the sorter detects from),
+    # then jog the gripper onto it and add the point.
+    def mark_battery(e):
+        try:
+            result = last_detection["result"]
+            view_pose = load_pose_from_file("VIEW_POSITION")
+            if robot is None:
+                calibration_text.value = "⚠️ Connect the robot first."
+            elif not result:
+                calibration_text.value = "⚠️ No battery detected to mark."
+            elif view_pose is None or not near_pose(robot.get_pose(max_age=0), view_pose):
+                calibration_text.value = "⚠️ Move the arm to VIEW_POSITION before marking; pixels from any other pose don't match the sorter's."
+            else:
+                x1, y1, x2, y2 = result["box"]
+                marked_pixel["center"] = [(x1 + x2) / 2, (y1 + y2) / 2]
+                marked_pixel["image_size"] = last_detection["image_size"]
+                calibration_text.value = f"🎯 Marked battery at pixel {marked_pixel['center']}. Move the gripper onto it."
+        except Exception as e:
+            calibration_text.value = f"❌ Error: {e}"
+        page.update()
+
+    def add_calibration_point(e):
+        if robot is None or marked_pixel["center"] is None:
+            calibration_text.value = "⚠️ Connect the robot and mark a battery first."
+            page.update()
+            return
+        try:
+            pose = robot.get_pose(max_age=0)
+            calibration_points.append({
+                "pixel": marked_pixel["center"],
+                "image_size": marked_pixel["image_size"],
+                "pose": [pose.x, pose.y, pose.z, pose.roll, pose.pitch, pose.yaw],
+            })
+            marked_pixel["center"] = None
+            calibration_text.value = f"Pick calibration: {len(calibration_points)}/{MIN_POINTS} points"
+        except Exception as e:
+            calibration_text.value = f"❌ Error: {e}"
+        page.update()
+
+    def save_pick_calibration(e):
+        try:
+            save_calibration(compute_calibration(calibration_points, detector_config["zoom_ratio"]))
+            calibration_text.value = f"✅ Pick calibration saved from {len(calibration_points)} points."
+        except Exception as e:
+            calibration_text.value = f"❌ Calibration failed: {e}"
+        page.update()
+
     # === Webcam Stream + Inference ===
     def stream_and_infer():
-        cap = cv2.VideoCapture(0)
-        zoom_ratio = 0.5
+        def camera_status(name, status, detail):
+            detection_text.value = f"📷 Camera {status}" + (f": {detail}" if detail else "")
+            page.update()
+
+        cap = CameraSupervisor(0, on_change=camera_status, zoom_ratio=detector_config["zoom_ratio"])
+        gate = MotionGate()
 
-        while cap.isOpened():
-            ret, frame = cap.read()
+        while True:
+            ret, frame, cropped_frame = cap.read_roi()
             if not ret:
                 continue
 
-            # Apply zoom crop
-            h, w = frame.shape[:2]
-            crop_h, crop_w = int(h * zoom_ratio), int(w * zoom_ratio)
-            y1 = h // 2 - crop_h // 2
-            x1 = w // 2 - crop_w // 2
-            cropped_frame = frame[y1:y1 + crop_h, x1:x1 + crop_w]
-
-            result = detect_battery_from_frame(frame)
+            result = gate.run(detect_battery_from_frame, frame, cropped_frame)
+            last_detection["result"] = result
+            last_detection["image_size"] = [cap.capture["width"], cap.capture["height"]]
             if result:
                 length = result.get("length", "—")
                 label = f"{result['size']} | {result['color']} | Length: {length}"
-                detection_text.value = f"🔍 Detected: {label}"
+                detection_text.value = f"🔍 Detected: {label} | {gate.stats()} | {cap.stats()}"
             else:
-                detection_text.value = "🔍 No battery detected."
+                detection_text.value = f"🔍 No battery detected. | {gate.stats()} | {cap.stats()}"
 
             image.src_base64 = encode_frame(cropped_frame)
             page.update()
@@ -121,8 +189,9 @@ def main(page: ft.Page):
             try:
                 if robot:
                     pose = robot.get_pose()
+                    gripper = robot.state()["gripper"]
                     pos = f"x: {pose.x:.3f}, y: {pose.y:.3f}, z: {pose.z:.3f}, roll: {pose.roll:.3f}, pitch: {pose.pitch:.3f}, yaw: {pose.yaw:.3f}"
-                    position_text.value = f"📍 Live Position: {pos}"
+                    position_text.value = f"📍 Live Position: {pos} | gripper: {gripper}"
                     page.update()
                 time.sleep(1)
             except:
@@ -140,6 +209,12 @@ def main(page: ft.Page):
             position_text,
             detection_text,
             status_text,
+            ft.Row([
+                ft.ElevatedButton("🎯 Mark Battery", on_click=mark_battery, bgcolor=ft.colors.BLUE_GREY_700),
+                ft.ElevatedButton("➕ Add Calibration Point", on_click=add_calibration_point, bgcolor=ft.colors.BLUE_GREY_700),
+                ft.ElevatedButton("💾 Save Calibration", on_click=save_pick_calibration, bgcolor=ft.colors.BLUE_600),
+            ], alignment=ft.MainAxisAlignment.CENTER),
+            calibration_text,
             ft.Divider(),
             image,
             ft.ElevatedButton("Exit", icon=ft.icons.CLOSE, bgcolor=ft.colors.PURPLE_700, on_click=lambda e: page.window_close())
@@ -148,7 +223,7 @@ def main(page: ft.Page):
 
     def on_window_close(e):
         if robot:
-            robot.close_connection()
+            robot.stop()
         page.window_destroy()
 
     page.on_window_close = on_window_close
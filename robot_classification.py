@@ -1,16 +1,32 @@
 import flet as ft
+import os
 import traceback
 import threading
 import time
 import cv2
 import base64
-from pyniryo import NiryoRobot, PoseObject
-from battery_detector import detect_battery_from_frame
-from weight import get_weight_from_esp32
+import random
+from pyniryo import PoseObject
+from battery_detector import detect_battery_from_frame, detect_batteries_from_frame, BatteryTracker, build_pick_queue, MotionGate
+from battery_detector import config as detector_config, measurer
+from robot_service import RobotService, RobotCommandError
+from supervisor import CameraSupervisor, ScaleSupervisor, RobotSupervisor
+from chemistry_classifier import MODEL_FILE, ChemistryClassifier, classify_by_rules, unambiguous_class, fast_path_pairs
+from sort_db import SortEventWriter, connect, weight_ranges
+from pick_calibration import PickCalibration
+from capture import load_capture_config
 from flet import Colors, Icons
 
 ROBOT_IP = "172.20.10.4"
 ESP32_IP = "172.20.10.2"
+MULTI_BATTERY_MODE = True
+CLASSIFIER_MIN_CONFIDENCE = 0.85
+
+# Vision-only fast path: skip the scale when size/color alone decide the class.
+FAST_PATH_ENABLED = False
+FAST_PATH_MIN_CONFIDENCE = 0.8
+FAST_PATH_AUDIT_RATES = {"alkaline": 0.05, "lithium": 0.2}  # per class; a sampled item is weighed anyway and compared
+FAST_PATH_DEFAULT_AUDIT_RATE = 0.1
 
 # === Positions ===
 VIEW_POSITION = PoseObject(0.351, 0.077, 0.219, 2.663, 1.049, 2.522)
@@ -24,6 +40,14 @@ ZINC_DROP = PoseObject(0.284, 0.026, 0.132, -0.630, 1.061, -0.431)
 LITHIUM_DROP = PoseObject(0.189, 0.024, 0.120, -0.715, 1.303, -0.750)
 UNKNOWN_DROP = PoseObject(0.443, -0.135, 0.166, -0.180, 1.354, -0.315)
 
+DROP_POSES = {
+    "alkaline": ALKALINE_DROP,
+    "NiMH": NiMH_DROP,
+    "zinc": ZINC_DROP,
+    "lithium": LITHIUM_DROP,
+    "unknown": UNKNOWN_DROP,
+}
+
 def main(page: ft.Page):
     page.title = "Zapsortbot | Robot Classification"
     page.scroll = ft.ScrollMode.AUTO
@@ -40,11 +64,20 @@ def main(page: ft.Page):
     )
 
     webcam_img = ft.Image(src="", width=640, height=480, expand=True)
+    health_text = ft.Text("", size=12, color=Colors.BLUE_200)
+    health = {}
 
     def log(msg):
         log_box.value += msg + "\n"
         log_box.update()
 
+    def report_health(name, status, detail):
+        icon = {"ok": "✅", "degraded": "⚠️", "down": "❌"}.get(status, "•")
+        log(f"{icon} {name} {status}" + (f": {detail}" if detail else ""))
+        health[name] = status
+        health_text.value = " | ".join(f"{n}: {s}" for n, s in health.items())
+        health_text.update()
+
     def update_webcam_view(frame):
         try:
             _, buffer = cv2.imencode('.jpg', frame)
@@ -60,6 +93,7 @@ def main(page: ft.Page):
             ft.Text("DropBot Robot Classification", size=22, weight=ft.FontWeight.BOLD)
         ], alignment=ft.MainAxisAlignment.CENTER)
     )
+    page.add(ft.Row([health_text], alignment=ft.MainAxisAlignment.CENTER))
 
     page.add(
         ft.Row([
@@ -70,7 +104,7 @@ def main(page: ft.Page):
 
     robot = None
     try:
-        robot = NiryoRobot(ROBOT_IP)
+        robot = RobotService(ROBOT_IP).start()
         log("✅ Connected to robot.")
         robot.calibrate_auto()
         robot.update_tool()
@@ -80,126 +114,210 @@ def main(page: ft.Page):
         log(traceback.format_exc())
         return
 
-    def zoom_center(frame, zoom_ratio=0.5):
-        h, w = frame.shape[:2]
-        crop_h, crop_w = int(h * zoom_ratio), int(w * zoom_ratio)
-        y1 = h // 2 - crop_h // 2
-        x1 = w // 2 - crop_w // 2
-        return frame[y1:y1 + crop_h, x1:x1 + crop_w]
+    conn = connect()
+    observed_weights = weight_ranges(conn)
+    conn.close()
+    if FAST_PATH_ENABLED:
+        pairs = fast_path_pairs(observed_weights)
+        if pairs:
+            log("⚡ Fast path covers: " + ", ".join(f"{size}/{color} → {c}" for (size, color), c in sorted(pairs.items())))
+        else:
+            log("⚡ Fast path: no weighed size/color is decided by vision alone yet; everything is weighed.")
+
+    calibration = PickCalibration.load()
+
+    def reachable(battery, roi_shape):
+        if calibration:
+            # Outside the taught workspace there is no pick pose; leave those out of the queue.
+            return calibration.pick_pose(battery) is not None
+        # Without a calibration the arm only grabs at PICK_POSITION, under the ROI center.
+        roi_h, roi_w = roi_shape[:2]
+        x1, y1, x2, y2 = battery["box"]
+        return x1 <= roi_w / 2 <= x2 and y1 <= roi_h / 2 <= y2
 
     def run_classification():
+        nonlocal calibration
         try:
-            cap = cv2.VideoCapture(0)
+            cap = CameraSupervisor(0, on_change=report_health, zoom_ratio=detector_config["zoom_ratio"])
+            if not cap.open():
+                log("❌ Could not open webcam.")
+                return
+            log(f"📷 Capture: {cap.stats()}")
+
+            # Both calibrations are in pixels of the capture they were taken at; refuse any other size.
+            image_size = (cap.capture["width"], cap.capture["height"])
+            capture_config = load_capture_config()
+            if image_size != (capture_config["width"], capture_config["height"]):
+                log(f"⚠️ Camera gave {image_size[0]}x{image_size[1]}, not the {capture_config['width']}x{capture_config['height']} "
+                    "in capture_config.yaml that pixel sizes and the detector were tuned at.")
+            if calibration and not calibration.matches(detector_config["zoom_ratio"], image_size):
+                log(f"⚠️ Pick calibration was taught on a different capture or ROI (now {image_size[0]}x{image_size[1]}). Using fixed PICK_POSITION.")
+                calibration = None
+            elif calibration:
+                log("🎯 Pick calibration loaded. Picking at the detected position.")
+            if measurer and not measurer.matches(image_size):
+                log(f"⚠️ Camera calibration is for {measurer.image_size[0]}x{measurer.image_size[1]}, capture is {image_size[0]}x{image_size[1]}. "
+                    "Sizes fall back to pixel lengths; run calibrate_camera.py again.")
+
+            # Recorded with every event so the classifier is only ever trained and used on one setup.
+            capture_context = {"zoom_ratio": detector_config["zoom_ratio"], "image_size": list(image_size)}
+            classifier = ChemistryClassifier.load(**capture_context)
+            if classifier:
+                log(f"🧠 Chemistry classifier loaded: {', '.join(classifier.classes)} ({classifier.context['length_units']} lengths)")
+            elif os.path.exists(MODEL_FILE):
+                log("⚠️ Chemistry classifier was trained on another ROI or capture size. Using the rules only.")
+            scale = ScaleSupervisor(ESP32_IP, on_change=report_health)
+            robot_supervisor = RobotSupervisor(robot, VIEW_POSITION, release_pose=UNKNOWN_DROP, on_change=report_health)
             log("🔍 Waiting for battery detection...")
             robot.move_pose(VIEW_POSITION)
+            tracker = BatteryTracker()
+            pick_queue = []
+            gate = MotionGate()
+            events = SortEventWriter()
+            audits = {}
 
             while True:
-                ret, frame = cap.read()
-                if not ret:
-                    log("⚠️ Failed to read frame.")
-                    continue
-
-                zoomed_frame = zoom_center(frame)
-                update_webcam_view(cv2.resize(zoomed_frame, (640, 480)))
-                battery = detect_battery_from_frame(frame)
-                if battery:
-                    log(f"🔍 Initial detection: {battery['size']}, {battery['color']} | Length: {battery.get('length', '—')}")
-                    time.sleep(2.0)
-                    ret, frame = cap.read()
-                    zoomed_frame = zoom_center(frame)
-                    update_webcam_view(cv2.resize(zoomed_frame, (640, 480)))
+                try:
+                    ret, frame, roi = cap.read_roi()
                     if not ret:
-                        log("⚠️ Failed to read frame after delay.")
                         continue
+                    started = time.time()
 
-                    battery = detect_battery_from_frame(frame)
-                    if not battery:
-                        log("⚠️ Battery moved out of frame after delay. Skipping...")
-                        continue
+                    update_webcam_view(cv2.resize(roi, (640, 480)))
+
+                    if MULTI_BATTERY_MODE:
+                        batteries = tracker.update(gate.run(detect_batteries_from_frame, frame, roi))
+                        queued_ids = {b["track_id"] for b in pick_queue}
+                        pick_queue = build_pick_queue(batteries, roi.shape, reachable=lambda b: reachable(b, roi.shape))
+                        if not pick_queue:
+                            continue
+
+                        # Batteries still queued from the last pass are already settled; skip the re-acquire.
+                        if pick_queue[0]["track_id"] not in queued_ids:
+                            log(f"🔍 Initial detection: {len(pick_queue)} batteries in view")
+                            time.sleep(2.0)
+                            ret, frame, roi = cap.read_roi()
+                            if not ret:
+                                log("⚠️ Failed to read frame after delay.")
+                                continue
+                            update_webcam_view(cv2.resize(roi, (640, 480)))
+                            batteries = tracker.update(detect_batteries_from_frame(frame, roi))
+                            pick_queue = build_pick_queue(batteries, roi.shape, reachable=lambda b: reachable(b, roi.shape))
+                            if not pick_queue:
+                                log("⚠️ Batteries moved out of frame after delay. Skipping...")
+                                continue
+
+                        battery = pick_queue.pop(0)
+                        tracker.forget(battery["track_id"])
+                        size = battery['size']
+                        color = battery['color']
+                        log(f"🔄 Picking #{battery['track_id']}: {size}, {color} | Length: {battery.get('length', '—')} | {len(pick_queue)} left in queue")
+                    else:
+                        battery = gate.run(detect_battery_from_frame, frame, roi)
+                        # Unreachable batteries are skipped quietly; the gate keeps returning them until something moves.
+                        if not battery or not reachable(battery, roi.shape):
+                            continue
+
+                        log(f"🔍 Initial detection: {battery['size']}, {battery['color']} | Length: {battery.get('length', '—')}")
+                        time.sleep(2.0)
+                        ret, frame, roi = cap.read_roi()
+                        if not ret:
+                            log("⚠️ Failed to read frame after delay.")
+                            continue
+                        update_webcam_view(cv2.resize(roi, (640, 480)))
+
+                        battery = detect_battery_from_frame(frame, roi)
+                        if not battery:
+                            log("⚠️ Battery moved out of frame after delay. Skipping...")
+                            continue
+                        if not reachable(battery, roi.shape):
+                            log("⚠️ Battery moved out of reach after delay. Skipping...")
+                            gate.reset()
+                            continue
 
-                    size = battery['size']
-                    color = battery['color']
-                    log(f"🔄 Final detection: {size}, {color} | Length: {battery.get('length', '—')}")
+                        size = battery['size']
+                        color = battery['color']
+                        log(f"🔄 Final detection: {size}, {color} | Length: {battery.get('length', '—')}")
 
+                    pick_pose = PICK_POSITION
+                    if calibration:
+                        pick_pose = calibration.pick_pose(battery)
+                        if pick_pose is None:
+                            log("⚠️ Battery is outside the calibrated pick area. Skipping...")
+                            continue
+
+                    gate.reset()
+                    detected = time.time()
                     robot.open_gripper()
-                    robot.move_pose(PICK_POSITION)
+                    robot.move_pose(pick_pose)
                     robot.close_gripper()
+                    picked = time.time()
                     robot.move_pose(LIFT_POSITION)
-                    robot.move_pose(WEIGHT_DROP)
-                    robot.open_gripper()
-                    time.sleep(1.0)
-
-                    weight = None
-                    for attempt in range(3):
-                        try:
-                            weight = get_weight_from_esp32(ESP32_IP)
-                            if weight is not None:
-                                break
-                            log(f"⚠️ Retry weight read {attempt + 1}/3...")
-                            time.sleep(0.5)
-                        except Exception as e:
-                            log(f"⚠️ Error reading weight: {e}")
-
-                    if weight is None:
-                        log("❌ Failed to read weight after 3 attempts. Returning to view.")
+
+                    vision_class = None
+                    if FAST_PATH_ENABLED and battery["confidence"] >= FAST_PATH_MIN_CONFIDENCE:
+                        vision_class = unambiguous_class(battery, observed_weights, classifier, CLASSIFIER_MIN_CONFIDENCE)
+                    audit = vision_class is not None and random.random() < FAST_PATH_AUDIT_RATES.get(vision_class, FAST_PATH_DEFAULT_AUDIT_RATE)
+
+                    weight = weighed = None
+                    if vision_class is not None and not audit:
+                        classification, source = vision_class, "vision"
+                    else:
+                        robot.move_pose(WEIGHT_DROP)
+                        robot.open_gripper()
+                        time.sleep(1.0)
+
+                        weight = scale.read_weight()
+                        weighed = time.time()
+                        if weight is None:
+                            log("❌ Failed to read weight. Returning to view.")
+                            robot.close_gripper()
+                            robot.move_pose(VIEW_POSITION)
+                            continue
+
+                        log(f"⚖️ Weight = {weight:.2f} g")
                         robot.close_gripper()
-                        robot.move_pose(VIEW_POSITION)
-                        continue
+                        robot.move_pose(LIFT_POSITION2)
 
-                    log(f"⚖️ Weight = {weight:.2f} g")
-                    robot.close_gripper()
-                    robot.move_pose(LIFT_POSITION2)
-
-                    classification = "unknown"
-                    drop_pose = UNKNOWN_DROP
-
-                    if size == "AA":
-                        if color == "green" and 20 <= weight < 24:
-                            classification = "unknown"
-                            drop_pose = UNKNOWN_DROP
-                        elif 20 <= weight < 24:
-                            classification = "alkaline"
-                            drop_pose = ALKALINE_DROP
-                        elif 13 <= weight < 15 or 17<=weight<18:
-                            classification = "lithium"
-                            drop_pose = LITHIUM_DROP
-                        elif color=="blue" and 24 <= weight <= 27:
-                            classification = "unknown"
-                            drop_pose = UNKNOWN_DROP
-                        elif 24 <= weight <= 27:
-                            classification = "NiMH"
-                            drop_pose = NiMH_DROP
-                        elif 14 <= weight < 17 or 10<=weight<13:
-                            classification = "zinc"
-                            drop_pose = ZINC_DROP
-                        else:
-                            classification = "unknown"
-                            drop_pose = UNKNOWN_DROP
-                    elif size == "AAA":
-                        if color == "green" and 9 <= weight <= 11:
-                            classification = "unknown"
-                            drop_pose = UNKNOWN_DROP
-                        elif 9 <= weight <= 11:
-                            classification = "alkaline"
-                            drop_pose = ALKALINE_DROP
-                        elif 5 < weight < 9:
-                            classification = "zinc"
-                            drop_pose = ZINC_DROP
-                        elif 3 <= weight < 5:
-                            classification = "lithium"
-                            drop_pose = LITHIUM_DROP
-                        elif color=="blue" and 11 < weight <= 13:
-                            classification = "unknown"
-                            drop_pose = UNKNOWN_DROP
-                        elif 11 < weight <= 13:
-                            classification = "NiMH"
-                            drop_pose = NiMH_DROP
-
-                    log(f"🔹 Classed as {classification.upper()}")
+                        classification = classify_by_rules(size, color, weight)
+                        source = "rules"
+                        if classifier:
+                            predicted, confidence = classifier.predict(battery, weight)
+                            if confidence >= CLASSIFIER_MIN_CONFIDENCE:
+                                classification, source = predicted, "model"
+
+                        if audit:
+                            stats = audits.setdefault(vision_class, [0, 0])
+                            stats[0] += 1
+                            if classification != vision_class:
+                                stats[1] += 1
+                                log(f"⚠️ Fast-path audit mismatch: vision said {vision_class.upper()}, weighing said {classification.upper()}")
+                            log(f"🔎 Fast-path audit {vision_class}: {stats[1]} mismatches in {stats[0]} audits")
+                            source = "audit"
+
+                    drop_key = classification if classification in DROP_POSES else "unknown"
+                    drop_pose = DROP_POSES[drop_key]
+
+                    log(f"🔹 Classed as {classification.upper()} ({source})")
                     robot.move_pose(drop_pose)
                     robot.open_gripper()
+                    events.add({**battery, **capture_context}, weight, classification, source, drop_key, {
+                        "started": started, "detected": detected, "picked": picked,
+                        "weighed": weighed, "dropped": time.time(),
+                    })
                     time.sleep(0.5)
                     robot.move_pose(VIEW_POSITION)
+                    robot_supervisor.mark_ok()
+                    log(f"📊 Detector: {gate.stats()} | Camera: {cap.stats()}")
+
+                except RobotCommandError as e:
+                    # Robot or connection error: park safely and keep sorting. Anything else reaches the outer handler.
+                    log("❌ Robot command failed:")
+                    log(traceback.format_exc())
+                    pick_queue = []
+                    gate.reset()
+                    robot_supervisor.recover(e)
+                    log("🔁 Recovered, resuming classification.")
 
         except Exception as e:
             log("❌ Unexpected error during classification:")
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from pyniryo import NiryoRobot
+
+GRIPPER_COMMANDS = {
+    "open_gripper": "open",
+    "release_with_tool": "open",
+    "close_gripper": "closed",
+    "grasp_with_tool": "closed",
+}
+
+class RobotCommandError(Exception):
+    # Raised to callers when the robot or its connection fails a command; the original error is the __cause__.
+    pass
+
+class RobotService:
+    # Owns the NiryoRobot connection. Every command runs on one worker thread, in order,
+    # and the worker keeps a timestamped copy of the robot state for UI readers.
+    def __init__(self, ip, poll_interval=1.0):
+        self.ip = ip
+        self.poll_interval = poll_interval
+        self.robot = None
+        self.commands = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self._state = {"pose": None, "gripper": "unknown", "busy": False, "error": None,
+                       "updated": 0.0, "pose_updated": 0.0}
+
+    def start(self):
+        self.robot = NiryoRobot(self.ip)
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.thread:
+            self.commands.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+        if self.robot:
+            self.robot.close_connection()
+            self.robot = None
+
+    # === Commands ===
+    def submit(self, name, *args, **kwargs):
+        future = Future()
+        self.commands.put((name, args, kwargs, future))
+        return future
+
+    def call(self, name, *args, **kwargs):
+        return self.submit(name, *args, **kwargs).result()
+
+    def reconnect(self):
+        return self.call(self._reconnect)
+
+    def _reconnect(self):
+        try:
+            self.robot.close_connection()
+        except Exception:
+            pass
+        self.robot = NiryoRobot(self.ip)
+        self.robot.calibrate_auto()
+        self.robot.update_tool()
+        self._set_state(gripper="unknown")
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+
+    # === Cached state ===
+    def state(self):
+        with self.lock:
+            return dict(self._state)
+
+    def get_pose(self, max_age=None):
+        state = self.state()
+        if state["pose"] is None or (max_age is not None and time.time() - state["pose_updated"] > max_age):
+            return self.call("get_pose")
+        return state["pose"]
+
+    def _set_state(self, **values):
+        with self.lock:
+            self._state.update(values)
+            self._state["updated"] = time.time()
+            if "pose" in values:
+                self._state["pose_updated"] = self._state["updated"]
+
+    def _refresh_pose(self):
+        try:
+            self._set_state(pose=self.robot.get_pose(), error=None)
+        except Exception as e:
+            self._set_state(error=str(e))
+
+    def _worker(self):
+        while True:
+            try:
+                item = self.commands.get(timeout=self.poll_interval)
+            except queue.Empty:
+                self._refresh_pose()
+                continue
+            if item is None:
+                break
+
+            name, args, kwargs, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._set_state(busy=True)
+            try:
+                command = getattr(self.robot, name) if isinstance(name, str) else name
+                result = command(*args, **kwargs)
+            except Exception as e:
+                self._set_state(busy=False, error=str(e))
+                error = RobotCommandError(f"{getattr(name, '__name__', name)}: {e}")
+                error.__cause__ = e
+                future.set_exception(error)
+                continue
+
+            # No pose round trip after each command: the idle poll refreshes the cached pose, and after
+            # anything that may have moved the arm get_pose(max_age) fetches a fresh one.
+            if name == "get_pose":
+                self._set_state(pose=result, busy=False, error=None)
+            elif name in GRIPPER_COMMANDS:
+                self._set_state(gripper=GRIPPER_COMMANDS[name], busy=False, error=None)
+            else:
+                self._set_state(busy=False, error=None, pose_updated=0.0)
+            future.set_result(result)
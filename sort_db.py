@@ -0,0 +1,145 @@
+import json
+import queue
+import sqlite3
+import threading
+import time
+
+SORT_DB = "sort_events.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sort_events (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    detected REAL,
+    picked REAL,
+    weighed REAL,
+    dropped REAL NOT NULL,
+    size TEXT,
+    color TEXT,
+    length INTEGER,
+    confidence REAL,
+    weight REAL,
+    classification TEXT NOT NULL,
+    source TEXT,
+    drop_pose TEXT,
+    detection TEXT,
+    label TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_sort_events_dropped ON sort_events (dropped, classification, size, weight);
+-- Dropped: the planner chose it for class_mix's GROUP BY and scanned the whole table.
+DROP INDEX IF EXISTS idx_sort_events_class;
+"""
+
+COLUMNS = ["started", "detected", "picked", "weighed", "dropped", "size", "color", "length",
+           "confidence", "weight", "classification", "source", "drop_pose", "detection"]
+
+def connect(path=SORT_DB):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    # Databases created before the label column existed.
+    if "label" not in {row[1] for row in conn.execute("PRAGMA table_info(sort_events)")}:
+        conn.execute("ALTER TABLE sort_events ADD COLUMN label TEXT")
+    return conn
+
+# === Labels ===
+# label stays NULL until a person checks or re-sorts the battery; the chemistry classifier trains only on those rows.
+def set_label(conn, event_id, label):
+    with conn:
+        conn.execute("UPDATE sort_events SET label = ? WHERE id = ?", (label, event_id))
+
+def unlabeled_events(conn, limit=50):
+    # Most recent weighed events still waiting for a person to confirm or correct them.
+    return conn.execute(
+        "SELECT id, dropped, size, color, weight, classification FROM sort_events "
+        "WHERE label IS NULL AND weight IS NOT NULL ORDER BY dropped DESC LIMIT ?", (limit,)).fetchall()
+
+def labeled_events(conn):
+    rows = conn.execute(
+        "SELECT detection, weight, label FROM sort_events "
+        "WHERE label IS NOT NULL AND weight IS NOT NULL AND detection IS NOT NULL ORDER BY dropped").fetchall()
+    return [(json.loads(detection), weight, label) for detection, weight, label in rows]
+
+def weight_ranges(conn):
+    # (size, color) -> (min, max, count) of every weighed event; the fast path sweeps only these weights.
+    rows = conn.execute(
+        "SELECT size, color, MIN(weight), MAX(weight), COUNT(*) FROM sort_events "
+        "WHERE weight IS NOT NULL GROUP BY size, color").fetchall()
+    return {(size, color): (low, high, count) for size, color, low, high, count in rows}
+
+# === Background writer ===
+class SortEventWriter:
+    # Collects events from the sort loop and writes them in batches on its own thread,
+    # so a slow disk never stalls the arm.
+    def __init__(self, path=SORT_DB, batch_size=50, flush_interval=2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.events = queue.Queue()
+        self.thread = threading.Thread(target=self._worker, daemon=True)
+        self.thread.start()
+
+    def add(self, battery, weight, classification, source, drop_pose, timestamps):
+        row = dict(timestamps)
+        row.update({
+            "size": battery.get("size"),
+            "color": battery.get("color"),
+            "length": battery.get("length"),
+            "confidence": battery.get("confidence"),
+            "weight": weight,
+            "classification": classification,
+            "source": source,
+            "drop_pose": drop_pose,
+            "detection": json.dumps(battery),
+        })
+        self.events.put(tuple(row.get(c) for c in COLUMNS))
+
+    def close(self):
+        self.events.put(None)
+        self.thread.join(timeout=5)
+
+    def _worker(self):
+        conn = connect(self.path)
+        sql = f"INSERT INTO sort_events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.events.get(timeout=max(deadline - time.monotonic(), 0.01))
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+            if batch:
+                with conn:
+                    conn.executemany(sql, batch)
+        conn.close()
+
+# === Dashboard queries ===
+def throughput(conn, window=3600, bucket=300):
+    since = time.time() - window
+    rows = conn.execute(
+        "SELECT CAST(dropped / ? AS INTEGER) AS b, COUNT(*) FROM sort_events WHERE dropped >= ? GROUP BY b ORDER BY b",
+        (bucket, since)).fetchall()
+    total = sum(count for _, count in rows)
+    per_hour = total * 3600 / window
+    return per_hour, [(b * bucket, count) for b, count in rows]
+
+def class_mix(conn, window=3600):
+    since = time.time() - window
+    return conn.execute(
+        "SELECT classification, COUNT(*), AVG(weight), MIN(weight), MAX(weight) FROM sort_events "
+        "WHERE dropped >= ? GROUP BY classification ORDER BY COUNT(*) DESC",
+        (since,)).fetchall()
+
+def unknown_rate_by_size(conn, window=3600):
+    since = time.time() - window
+    return conn.execute(
+        "SELECT size, AVG(classification = 'unknown'), COUNT(*) FROM sort_events "
+        "WHERE dropped >= ? GROUP BY size ORDER BY size",
+        (since,)).fetchall()
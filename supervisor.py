@@ -0,0 +1,158 @@
+import time
+import cv2
+from weight import get_weight_from_esp32
+from capture import negotiate_capture, describe_capture, crop_roi
+
+class Backoff:
+    def __init__(self, base=0.1, maximum=5.0, factor=2.0):
+        self.base = base
+        self.maximum = maximum
+        self.factor = factor
+        self.delay = base
+
+    def wait(self):
+        time.sleep(self.delay)
+        self.delay = min(self.delay * self.factor, self.maximum)
+
+    def reset(self):
+        self.delay = self.base
+
+class Supervised:
+    # Tracks consecutive failures and reports "ok" / "degraded" / "down" only when the status changes,
+    # so a flaky device doesn't flood the log.
+    def __init__(self, name, on_change=None, down_after=5, backoff=None):
+        self.name = name
+        self.on_change = on_change
+        self.down_after = down_after
+        self.backoff = backoff or Backoff()
+        self.status = "starting"
+        self.detail = ""
+        self.failures = 0
+
+    def health(self):
+        return {"status": self.status, "failures": self.failures, "detail": self.detail}
+
+    def mark_ok(self):
+        # For callers that see a device succeed outside the supervisor, e.g. a completed robot cycle.
+        self._ok()
+
+    def _set_status(self, status, detail=""):
+        if status == self.status:
+            return
+        self.status, self.detail = status, detail
+        if self.on_change:
+            self.on_change(self.name, status, detail)
+
+    def _ok(self):
+        self.failures = 0
+        self.backoff.reset()
+        self._set_status("ok")
+
+    def _fail(self, detail):
+        self.failures += 1
+        self._set_status("degraded" if self.failures < self.down_after else "down", detail)
+        self.backoff.wait()
+
+# === Camera ===
+class CameraSupervisor(Supervised):
+    # With a zoom_ratio, the capture format from capture_config.yaml is negotiated on every (re)open
+    # and read_roi() hands out the center crop as a view.
+    def __init__(self, index=0, reopen_after=5, on_change=None, zoom_ratio=None):
+        super().__init__("camera", on_change, down_after=reopen_after)
+        self.index = index
+        self.reopen_after = reopen_after
+        self.zoom_ratio = zoom_ratio
+        self.cap = None
+        self.capture = None
+        self.decode_ms = None
+
+    def open(self):
+        self.cap = cv2.VideoCapture(self.index)
+        if not self.cap.isOpened():
+            return False
+        if self.zoom_ratio:
+            self.capture = negotiate_capture(self.cap)
+        else:
+            self.capture = describe_capture(self.cap)
+        return True
+
+    def isOpened(self):
+        return self.cap is not None and self.cap.isOpened()
+
+    def read(self):
+        if not self.isOpened() and not self.open():
+            self._fail("camera not available")
+            return False, None
+
+        # grab() waits for the next frame; retrieve() is where it gets decoded.
+        ret = self.cap.grab()
+        if ret:
+            start = time.perf_counter()
+            ret, frame = self.cap.retrieve()
+            elapsed = (time.perf_counter() - start) * 1000
+            self.decode_ms = elapsed if self.decode_ms is None else 0.9 * self.decode_ms + 0.1 * elapsed
+        if ret:
+            self._ok()
+            return ret, frame
+
+        self._fail("frame read failed")
+        if self.failures % self.reopen_after == 0:
+            self.release()
+        return False, None
+
+    def read_roi(self):
+        ret, frame = self.read()
+        if not ret:
+            return False, None, None
+        return ret, frame, crop_roi(frame, self.zoom_ratio) if self.zoom_ratio else frame
+
+    def stats(self):
+        if not self.capture:
+            return "camera not open"
+        c = self.capture
+        decode = f"{self.decode_ms:.2f} ms" if self.decode_ms is not None else "—"
+        return f"{c['width']}x{c['height']} {c['fourcc']} @ {c['fps']:.0f} fps | decode {decode}/frame"
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+
+# === Scale ===
+class ScaleSupervisor(Supervised):
+    def __init__(self, esp32_ip, on_change=None):
+        super().__init__("scale", on_change, down_after=3)
+        self.esp32_ip = esp32_ip
+
+    def read_weight(self, attempts=4):
+        for _ in range(attempts):
+            weight = get_weight_from_esp32(self.esp32_ip)
+            if weight is not None:
+                self._ok()
+                return weight
+            self._fail("no weight reading")
+        return None
+
+# === Robot ===
+class RobotSupervisor(Supervised):
+    def __init__(self, service, safe_pose, release_pose=None, on_change=None):
+        super().__init__("robot", on_change, down_after=3, backoff=Backoff(base=1.0, maximum=30.0))
+        self.service = service
+        self.safe_pose = safe_pose
+        self.release_pose = release_pose
+
+    def recover(self, error):
+        # Reconnect, drop anything still in the gripper at release_pose, then park at safe_pose.
+        detail = str(error)
+        while True:
+            self._fail(detail)
+            try:
+                self.service.reconnect()
+                if self.release_pose is not None:
+                    self.service.move_pose(self.release_pose)
+                    self.service.open_gripper()
+                self.service.move_pose(self.safe_pose)
+                self._ok()
+                return
+            except Exception as e:
+                detail = str(e)
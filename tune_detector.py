@@ -0,0 +1,125 @@
+import os
+import time
+import itertools
+import cv2
+import yaml
+from battery_detector import crop_roi, predict_boxes, DETECTOR_CONFIG
+
+# Recorded frames and YOLO labels (annotation.py output). Those frames are already
+# cropped at RECORDED_ZOOM, so smaller zoom ratios are applied on top of it.
+FRAMES_DIR = "images/val"
+LABELS_DIR = "labels/val"
+RECORDED_ZOOM = 0.5
+
+IMG_SIZES = [320, 416, 512, 640]
+ZOOM_RATIOS = [0.5, 0.45, 0.4, 0.35]
+CONF_THRESHOLDS = [0.25, 0.3, 0.4, 0.5]
+IOU_THRESHOLDS = [0.45, 0.5, 0.6]
+ACCURACY_FLOOR = 0.9  # minimum F1 at IoU 0.5
+MATCH_IOU = 0.5
+WARMUP_RUNS = 3
+
+def load_recordings():
+    samples = []
+    for name in sorted(os.listdir(FRAMES_DIR)):
+        if not name.lower().endswith((".jpg", ".png")):
+            continue
+        frame = cv2.imread(os.path.join(FRAMES_DIR, name))
+        if frame is None:
+            continue
+        h, w = frame.shape[:2]
+        boxes = []
+        label_path = os.path.join(LABELS_DIR, os.path.splitext(name)[0] + ".txt")
+        if os.path.exists(label_path):
+            with open(label_path, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 5:
+                        continue
+                    _, xc, yc, bw, bh = map(float, parts)
+                    boxes.append(((xc - bw / 2) * w, (yc - bh / 2) * h, (xc + bw / 2) * w, (yc + bh / 2) * h))
+        samples.append((frame, boxes))
+    return samples
+
+def box_iou(a, b):
+    ix = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0
+
+def crop_sample(frame, boxes, zoom_ratio):
+    relative = zoom_ratio / RECORDED_ZOOM
+    h, w = frame.shape[:2]
+    crop = crop_roi(frame, relative)
+    oy, ox = h // 2 - int(h * relative) // 2, w // 2 - int(w * relative) // 2
+    shifted = []
+    for x1, y1, x2, y2 in boxes:
+        shifted.append((x1 - ox, y1 - oy, x2 - ox, y2 - oy))
+    # Batteries whose center falls outside the ROI still count as ground truth, so a
+    # ROI that cuts them off is scored as missing them.
+    return crop, shifted
+
+def score(detections, truths):
+    tp = 0
+    used = set()
+    for det in detections:
+        best, best_iou = None, MATCH_IOU
+        for i, truth in enumerate(truths):
+            iou = box_iou(det, truth)
+            if i not in used and iou >= best_iou:
+                best, best_iou = i, iou
+        if best is not None:
+            used.add(best)
+            tp += 1
+    return tp, len(detections) - tp, len(truths) - tp
+
+def sweep(samples):
+    results = []
+    for imgsz, zoom_ratio, iou in itertools.product(IMG_SIZES, ZOOM_RATIOS, IOU_THRESHOLDS):
+        if zoom_ratio > RECORDED_ZOOM:
+            continue
+        settings = {"imgsz": imgsz, "zoom_ratio": zoom_ratio, "conf": min(CONF_THRESHOLDS), "iou": iou}
+        crops = [crop_sample(frame, boxes, zoom_ratio) for frame, boxes in samples]
+
+        for crop, _ in crops[:WARMUP_RUNS]:
+            predict_boxes(crop, settings)
+
+        # Run once at the lowest conf; higher thresholds are filters on the same output.
+        predictions = []
+        start = time.perf_counter()
+        for crop, _ in crops:
+            predictions.append(predict_boxes(crop, settings))
+        latency_ms = (time.perf_counter() - start) * 1000 / max(len(crops), 1)
+
+        for conf in CONF_THRESHOLDS:
+            tp = fp = fn = 0
+            for boxes, (_, truths) in zip(predictions, crops):
+                detections = [tuple(map(float, b[:4])) for b in boxes if b[4] >= conf]
+                t, p, n = score(detections, truths)
+                tp, fp, fn = tp + t, fp + p, fn + n
+            precision = tp / (tp + fp) if tp + fp else 0
+            recall = tp / (tp + fn) if tp + fn else 0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0
+            results.append({**settings, "conf": conf, "latency_ms": latency_ms, "precision": precision, "recall": recall, "f1": f1})
+            print(f"imgsz={imgsz:<4} zoom={zoom_ratio:.2f} conf={conf:.2f} iou={iou:.2f} | {latency_ms:6.1f} ms | P={precision:.2f} R={recall:.2f} F1={f1:.2f}")
+    return results
+
+def pick_best(results):
+    passing = [r for r in results if r["f1"] >= ACCURACY_FLOOR]
+    if not passing:
+        return None
+    return min(passing, key=lambda r: (r["latency_ms"], -r["f1"]))
+
+if __name__ == "__main__":
+    samples = load_recordings()
+    print(f"📂 Loaded {len(samples)} recorded frames from {FRAMES_DIR}")
+    results = sweep(samples)
+    best = pick_best(results)
+    if best is None:
+        print(f"❌ No setting reached F1 >= {ACCURACY_FLOOR}; {DETECTOR_CONFIG} left unchanged.")
+    else:
+        config = {k: best[k] for k in ("imgsz", "zoom_ratio", "conf", "iou")}
+        with open(DETECTOR_CONFIG, 'w') as f:
+            yaml.dump(config, f)
+        print(f"✅ Best: {config} | {best['latency_ms']:.1f} ms | F1={best['f1']:.2f} → saved to {DETECTOR_CONFIG}")